@@ -305,15 +305,33 @@ _C.DATA.TEST_CROP_SIZE = 256
 # frame sampling.
 _C.DATA.TARGET_FPS = 30
 
-# Decoding backend, options include `pyav` or `torchvision`
+# Decoding backend, options include `pyav`, `torchvision` or `decord`
 #_C.DATA.DECODING_BACKEND = "pyav"
 _C.DATA.DECODING_BACKEND = "torchvision"
 
+# If True, the `decord` backend decodes videos with NVDEC on the GPU of the
+# current process. The data loader workers are then started with `spawn` and
+# return CUDA tensors, so pinned memory is not used.
+_C.DATA.DECORD_USE_GPU = False
+
 # if True, each video should be represented as a tar file containing jpeg sequence of each frame.
 _C.DATA.USE_FRAME_SEQUENCES = True
 
+# File name suffix of the frames of a sequence. Its extension selects the
+# frame files, e.g. "_{:02d}.jpg" for frames re-encoded to jpeg.
 _C.DATA.FRAME_SEQUENCE_TEMPLATE = "_{:02d}.png"
 
+# If True, read the decoded frame sequences from the memory mapped shards of
+# each class (`<class dir>.bin` and `<class dir>.json`) written by
+# experiments/pack_frames.py, instead of decoding the frame images.
+_C.DATA.USE_FRAME_SHARDS = False
+
+# If True, the frames were resized offline so that their short side is
+# TRAIN_JITTER_SCALES[1] (see experiments/convert_frames.py). The training
+# and validation frames are then only cropped and flipped at loading time,
+# without any resizing. Test frames are still resized to the test scale.
+_C.DATA.PRERESIZED = False
+
 # if True, sample uniformly in [1 / max_scale, 1 / min_scale] and take a
 # reciprocal to get the scale. If False, take a uniform sample from
 # [min_scale, max_scale].
@@ -331,6 +349,25 @@ _C.DATA.ENSEMBLE_METHOD = "sum"
 # If True, revert the default input channel (RBG <-> BGR).
 _C.DATA.REVERSE_INPUT_CHANNEL = False
 
+# If True, the data loader returns uint8 clips and the color normalization is
+# performed after the batch is transferred to the device of the model. This
+# cuts the size of the batches sent from the workers by 4x. Only supported by
+# the kinetics dataset.
+_C.DATA.NORMALIZE_ON_DEVICE = False
+
+# If True, the data loader returns batches in the channels last memory format
+# (`torch.channels_last_3d`), reordered while the clips are copied into the
+# batch, and the 3D convolution weights of the model use the same format,
+# which is faster on tensor cores.
+_C.DATA.CHANNELS_LAST = False
+
+# If True, the data loader workers return uncropped uint8 clips, and the
+# resize and crop of the spatial sampling are performed on the GPU on a side
+# CUDA stream, overlapped with the model. The uncropped clips of a batch must
+# have the same size, so this requires DATA.USE_FRAME_SEQUENCES without
+# DATA.PRERESIZED, as well as DATA.NORMALIZE_ON_DEVICE.
+_C.DATA.GPU_SPATIAL_SAMPLING = False
+
 
 # ---------------------------------------------------------------------------- #
 # Optimizer options
@@ -446,6 +483,32 @@ _C.DATA_LOADER.PIN_MEMORY = True
 # Enable multi thread decoding.
 _C.DATA_LOADER.ENABLE_MULTI_THREAD_DECODE = False
 
+# Keep the data loader workers alive across epochs, together with their frame
+# caches, decoding threads and memory mapped shards.
+_C.DATA_LOADER.PERSISTENT_WORKERS = True
+
+# Number of batches loaded in advance by each worker. Values above 4 bring
+# little speedup and increase the host memory usage.
+_C.DATA_LOADER.PREFETCH_FACTOR = 4
+
+# Size in GB of the cache of decoded frame sequences in
+# DATA_LOADER.FRAME_CACHE_DIR. Repeatedly sampled clips are then served from
+# memory instead of being decoded again. The cache is shared by all the data
+# loader workers of all the loaders and ranks of the host, so the size bounds
+# the memory used by the cache on the host. Clips are not evicted: once the
+# cache is full, new clips are decoded without being cached. If 0, disable
+# the cache.
+_C.DATA_LOADER.FRAME_CACHE_SIZE_GB = 0.0
+
+# Directory of the cache of decoded frame sequences, in shared memory by
+# default. It outlives the job, so that later runs start with a warm cache.
+# Remove it to free the memory, or when the frames change on disk.
+_C.DATA_LOADER.FRAME_CACHE_DIR = "/dev/shm/corr_net_frame_cache"
+
+# Number of threads used by each data loader worker to decode the frames of a
+# frame sequence concurrently. If 1, decode the frames sequentially.
+_C.DATA_LOADER.NUM_DECODE_THREADS = 1
+
 
 # ---------------------------------------------------------------------------- #
 # Detection options.
@@ -798,6 +861,22 @@ def _assert_and_infer_cfg(cfg):
     if cfg.SOLVER.BASE_LR_SCALE_NUM_SHARDS:
         cfg.SOLVER.BASE_LR *= cfg.NUM_SHARDS
 
+    # DATA assertions.
+    if cfg.DATA.DECORD_USE_GPU:
+        assert cfg.DATA.DECODING_BACKEND == "decord"
+        assert cfg.NUM_GPUS > 0
+    if cfg.DATA.NORMALIZE_ON_DEVICE:
+        # Only the kinetics dataset returns uint8 clips.
+        assert cfg.TRAIN.DATASET == "kinetics"
+        assert cfg.TEST.DATASET == "kinetics"
+    if cfg.DATA.GPU_SPATIAL_SAMPLING:
+        assert cfg.NUM_GPUS > 0
+        assert cfg.DATA.NORMALIZE_ON_DEVICE
+        assert cfg.DATA.USE_FRAME_SEQUENCES
+        assert not cfg.DATA.PRERESIZED
+        assert not cfg.DETECTION.ENABLE
+        assert not (cfg.MULTIGRID.SHORT_CYCLE or cfg.MULTIGRID.LONG_CYCLE)
+
     # General assertions.
     assert cfg.SHARD_ID < cfg.NUM_SHARDS
     return cfg
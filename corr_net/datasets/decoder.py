@@ -5,6 +5,7 @@
 
 import math
 import os
+from concurrent.futures import as_completed
 from pathlib import Path
 import numpy as np
 import random
@@ -13,6 +14,19 @@ import torch
 import torchvision.io as io
 from six import BytesIO
 
+# Optional SIMD decoders for frame sequences, falling back to Pillow.
+try:
+    from turbojpeg import TJPF_RGB, TurboJPEG
+
+    _turbo_jpeg = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    _turbo_jpeg = None
+
+try:
+    import pyspng
+except ImportError:
+    pyspng = None
+
 
 def temporal_sampling(frames, start_idx, end_idx, num_samples):
     """
@@ -223,6 +237,35 @@ def torchvision_decode(
     return v_frames, fps, decode_all_video
 
 
+def decord_decode(
+    container, sampling_rate, num_frames, clip_idx, num_clips=10, target_fps=30
+):
+    """
+    Sample a clip from the video and decode only its frames with decord. If
+    the video reader was created on a GPU, the frames are decoded with NVDEC
+    and returned on that GPU.
+    Args:
+        container (VideoReader): decord video reader.
+        (other args): same as in `pyav_decode` function.
+    Returns:
+        frames (tensor): the `num_frames` sampled frames of the clip, with
+            dimension of `num frames` x `height` x `width` x `channel`.
+        fps (float): the number of frames per second of the video.
+    """
+    fps = float(container.get_avg_fps())
+    frames_length = len(container)
+    start_idx, end_idx = get_start_end_idx(
+        frames_length,
+        sampling_rate * num_frames / target_fps * fps,
+        clip_idx,
+        num_clips,
+    )
+    index = torch.linspace(start_idx, end_idx, num_frames)
+    index = torch.clamp(index, 0, frames_length - 1).long()
+    frames = container.get_batch(index.tolist())
+    return frames, fps
+
+
 def pyav_decode(
     container, sampling_rate, num_frames, clip_idx, num_clips=10, target_fps=30
 ):
@@ -320,18 +363,30 @@ def decode(
             at `pytorch/vision/torchvision/io/_video_opt.py`.
         target_fps (int): the input video may have different fps, convert it to
             the target video fps before frame sampling.
-        backend (str): decoding backend includes `pyav` and `torchvision`. The
-            default one is `pyav`.
+        backend (str): decoding backend includes `pyav`, `torchvision` and
+            `decord`. The default one is `pyav`.
         max_spatial_scale (int): keep the aspect ratio and resize the frame so
             that shorter edge size is max_spatial_scale. Only used in
             `torchvision` backend.
     Returns:
         frames (tensor): decoded frames from the video.
     """
-    # Currently support two decoders: 1) PyAV, and 2) TorchVision.
+    # Currently support three decoders: 1) PyAV, 2) TorchVision, and 3) decord.
     assert clip_idx >= -1, "Not valied clip_idx {}".format(clip_idx)
     try:
-        if backend == "pyav":
+        if backend == "decord":
+            # decord decodes the sampled frames only, so there is no temporal
+            # sampling left to do.
+            frames, _ = decord_decode(
+                container,
+                sampling_rate,
+                num_frames,
+                clip_idx,
+                num_clips,
+                target_fps,
+            )
+            return frames if frames.size(0) > 0 else None
+        elif backend == "pyav":
             frames, fps, decode_all_video = pyav_decode(
                 container,
                 sampling_rate,
@@ -375,12 +430,55 @@ def decode(
     frames = temporal_sampling(frames, start_idx, end_idx, num_frames)
     return frames
 
+def load_frame(path, size=(224, 224)):
+    """
+    Decode a single frame image and resize it. Jpeg frames are decoded with
+    libjpeg-turbo if PyTurboJPEG is installed, and png frames with libspng if
+    pyspng is installed. Otherwise, Pillow is used.
+    Args:
+        path (str): path to the image.
+        size (tuple or None): (width, height) of the resized frame. If None,
+            keep the original size.
+    Returns:
+        frame (ndarray): uint8 RGB frame of `height` x `width` x `channel`.
+    """
+    with open(path, "rb") as f:
+        raw = f.read()
+    ext = os.path.splitext(path)[1].lower()
+    frame = None
+    if _turbo_jpeg is not None and ext in [".jpg", ".jpeg"]:
+        frame = _turbo_jpeg.decode(raw, pixel_format=TJPF_RGB)
+    elif pyspng is not None and ext == ".png":
+        frame = pyspng.load(raw)
+        # Leave grayscale and 16-bit frames to Pillow.
+        if (
+            frame.dtype != np.uint8
+            or frame.ndim != 3
+            or frame.shape[2] not in [3, 4]
+        ):
+            frame = None
+        else:
+            frame = frame[:, :, :3]
+    if frame is None:
+        img = Image.open(BytesIO(raw)).convert("RGB")
+    elif size is None:
+        # Frames decoded natively only go through Pillow to be resized.
+        return frame
+    else:
+        img = Image.fromarray(frame)
+    if size is not None:
+        img = img.resize(size)
+    return np.asarray(img)
+
+
 def decode_seq(
     tar_handler,
     sampling_rate,
     frames_list,
     video_meta,
     num_frames,
+    pool=None,
+    frame_size=(224, 224),
 ):
     """
     Decode tar wrapped frame sequence and perform temporal sampling.
@@ -388,6 +486,10 @@ def decode_seq(
         tar_handler: tarfile handler.
         frames_list (list): file names of all frames in the tar file. 
         (other args): same as in `decode` function. 
+        pool (ThreadPoolExecutor, optional): if given, decode the frames
+            concurrently with the threads of the pool.
+        frame_size (tuple or None): (width, height) to resize the frames to.
+            If None, keep the size of the frames on disk.
     Returns:
         frames (tensor): decoded frames from the tar file.
     """
@@ -410,27 +512,33 @@ def decode_seq(
     #frame_indices = temporal_sampling_indices(
                         #frames_length, start_idx, end_idx, num_frames)
 
-    frames = []
     frames_list.sort()
+    frame_indices = range(0, 27)
     try:
-        for idx in range(0, 27):
-            # file name of frames start from 1
-            #filename = self.cfg.DATA.FRAME_SEQUENCE_TEMPLATE.format(int(idx))
-            #print('filename = ', filename)
-            #img = Image.open(io.BytesIO(tar.extractfile(filename).read())).convert('RGB')
-            #print('os.path.join(frames_list[idx]) = ', Path(frames_list[idx]))
-            #print('frames_list[idx] = ', frames_list[idx])
-            img = Image.open(open(frames_list[idx], 'rb')).convert('RGB')
-            size = (224, 224)
-            img_1 = img.resize(size)
-            frames.append(np.asarray(img_1))
-            #print('len(frames) = ', frames)
+        if pool is None:
+            frames = [
+                load_frame(frames_list[idx], frame_size)
+                for idx in frame_indices
+            ]
+            frames = torch.as_tensor(np.stack(frames))
+        else:
+            # The first frame gives the shape of the clip. Fill the other
+            # decoded frames into their slots as they complete.
+            first_frame = load_frame(frames_list[frame_indices[0]], frame_size)
+            frames = torch.empty(
+                (len(frame_indices),) + first_frame.shape, dtype=torch.uint8
+            )
+            frames_np = frames.numpy()
+            frames_np[0] = first_frame
+            futures = {
+                pool.submit(load_frame, frames_list[idx], frame_size): slot
+                for slot, idx in enumerate(frame_indices)
+                if slot > 0
+            }
+            for future in as_completed(futures):
+                frames_np[futures[future]] = future.result()
     except Exception as e:
         print("Failed to decode image with exception: {}".format(e))
         return None
 
-    if not frames:
-        return None
-
-    frames = torch.as_tensor(np.stack(frames))
     return frames
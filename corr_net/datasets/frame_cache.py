@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+"""Cache of decoded frame sequences shared by all the loading processes."""
+
+import hashlib
+import os
+import numpy as np
+import torch
+
+
+class FrameCache(object):
+    """
+    Keep decoded clips as `.npy` files in a directory, by default in shared
+    memory (`/dev/shm`), keyed by the hash of the path of the frame sequence.
+    Every data loader worker of every loader and rank on the host reads and
+    writes the same directory, so a clip decoded once is served to all of
+    them. Clips are written to a temporary file and renamed, so that readers
+    only see complete files, and read back with a copy-on-write memory map.
+    Clips are never evicted: once the directory holds `capacity_bytes`, new
+    clips are no longer cached. The directory outlives the job, so that
+    later runs start with a warm cache, and has to be removed by hand to
+    free the memory or after the frames changed on disk.
+    """
+
+    def __init__(self, cache_dir, capacity_bytes):
+        """
+        Args:
+            cache_dir (str): directory of the cached clips.
+            capacity_bytes (int): maximal total size of the cached clips in
+                bytes. If 0, nothing is cached.
+        """
+        self.cache_dir = cache_dir
+        self.capacity_bytes = capacity_bytes
+        self._full = False
+        if capacity_bytes > 0:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(
+            self.cache_dir,
+            hashlib.sha1(key.encode("utf-8")).hexdigest() + ".npy",
+        )
+
+    def _size_bytes(self):
+        """
+        Returns:
+            size_bytes (int): total size of the clips in the directory,
+                including the ones written by other processes.
+        """
+        size_bytes = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".npy"):
+                try:
+                    size_bytes += entry.stat().st_size
+                except FileNotFoundError:
+                    pass
+        return size_bytes
+
+    def get(self, key):
+        """
+        Args:
+            key (str): path of the frame sequence.
+        Returns:
+            frames (tensor or None): the cached frames, or None on a miss.
+        """
+        if self.capacity_bytes <= 0:
+            return None
+        try:
+            frames = np.load(self._path(key), mmap_mode="c")
+        except (FileNotFoundError, ValueError):
+            return None
+        return torch.from_numpy(frames)
+
+    def put(self, key, frames):
+        """
+        Cache the frames, unless they are already cached or the cache is
+        full. Concurrent writers may exceed the capacity by about one clip
+        each.
+        Args:
+            key (str): path of the frame sequence.
+            frames (tensor): decoded frames.
+        """
+        if self.capacity_bytes <= 0 or self._full:
+            return
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+        nbytes = frames.element_size() * frames.nelement()
+        if self._size_bytes() + nbytes > self.capacity_bytes:
+            # Clips are never evicted, so the cache stays full.
+            self._full = True
+            return
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        try:
+            with open(tmp_path, "wb") as f:
+                np.save(f, frames.numpy())
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
@@ -3,18 +3,23 @@
 # 
 # Modification: enable loading image sequences.
 
+import functools
+import json
 import os
-import random
 import tarfile
 import io
-import glob
+import numpy as np
+import pandas as pd
 import torch
+from concurrent.futures import ThreadPoolExecutor
 import torch.utils.data
 from fvcore.common.file_io import PathManager
 
+import corr_net.utils.distributed as du
 import corr_net.utils.logging as logging
 
 from . import decoder as decoder
+from . import frame_cache as frame_cache
 from . import utils as utils
 from . import video_container as container
 from .build import DATASET_REGISTRY
@@ -22,6 +27,53 @@ from .build import DATASET_REGISTRY
 logger = logging.get_logger(__name__)
 
 
+@functools.lru_cache(maxsize=None)
+def _get_decode_pool(pid, num_threads):
+    """
+    Get the thread pool of the current process to decode the frames of a
+    sequence. Like the frame cache, it is created once per process, as
+    threads do not survive a fork.
+    Args:
+        pid (int): id of the current process.
+        num_threads (int): number of decoding threads.
+    Returns:
+        pool (ThreadPoolExecutor or None): the thread pool, or None if frames
+            are decoded sequentially.
+    """
+    if num_threads <= 1:
+        return None
+    return ThreadPoolExecutor(max_workers=num_threads)
+
+
+def _scan_frame_dir(dirname, ext=".png"):
+    """
+    List the frames in a directory and group them by sample. Frames are
+    named `<sample>_<frame idx><ext>`.
+    Args:
+        dirname (str): path to the directory containing the frames.
+        ext (str): file extension of the frames.
+    Returns:
+        frame_index (dict): maps each sample name to the sorted list of paths
+            of its frames. Empty if the directory can not be read.
+    """
+    frame_index = {}
+    try:
+        entries = sorted(
+            entry.name
+            for entry in os.scandir(dirname)
+            if entry.name.endswith(ext)
+        )
+    except OSError as e:
+        logger.warning("Failed to scan frames in {}: {}".format(dirname, e))
+        return frame_index
+    for name in entries:
+        sample_name = name.rsplit("_", 1)[0]
+        frame_index.setdefault(sample_name, []).append(
+            os.path.join(dirname, name)
+        )
+    return frame_index
+
+
 @DATASET_REGISTRY.register()
 class Kinetics(torch.utils.data.Dataset):
     """
@@ -67,9 +119,26 @@ class Kinetics(torch.utils.data.Dataset):
         ], "Split '{}' not supported for Kinetics".format(mode)
         self.mode = mode
         self.cfg = cfg
+        self._frame_ext = os.path.splitext(
+            cfg.DATA.FRAME_SEQUENCE_TEMPLATE
+        )[1]
 
         self._video_meta = {}
         self._num_retries = num_retries
+        # Built once instead of on every color normalization, shaped to
+        # broadcast over `channel` x `num frames` x `height` x `width` clips,
+        # and scaled to the [0, 255] range of the decoded frames.
+        self._mean = torch.tensor(cfg.DATA.MEAN).view(-1, 1, 1, 1) * 255.0
+        self._std = torch.tensor(cfg.DATA.STD).view(-1, 1, 1, 1) * 255.0
+        # Decoded clips shared by all the loading processes of the host.
+        self._frame_cache = frame_cache.FrameCache(
+            cfg.DATA_LOADER.FRAME_CACHE_DIR,
+            int(cfg.DATA_LOADER.FRAME_CACHE_SIZE_GB * 2 ** 30),
+        )
+        # GPU of the current process, used to decode videos with NVDEC.
+        self._decode_gpu_id = (
+            torch.cuda.current_device() if cfg.DATA.DECORD_USE_GPU else None
+        )
         # For training or validation mode, one single clip is sampled from every
         # video. For testing, NUM_ENSEMBLE_VIEWS clips are sampled from every
         # video. For every clip, NUM_SPATIAL_CROPS is cropped spatially from
@@ -83,6 +152,10 @@ class Kinetics(torch.utils.data.Dataset):
 
         logger.info("Constructing Kinetics {}...".format(mode))
         self._construct_loader()
+        # Rank of the current process, read before the dataset is copied to
+        # the data loader workers.
+        self._rank = du.get_rank()
+        self.reset_fallback_queue(0)
 
     def _construct_loader(self):
         """
@@ -100,69 +173,204 @@ class Kinetics(torch.utils.data.Dataset):
             path_to_file
         )
 
-        self._path_to_videos = []
-        self._labels = []
-        self._spatial_temporal_idx = []
+        if self.cfg.DATA.USE_FRAME_SEQUENCES:
+            columns = [
+                "set_name", "class_name", "class_sample", "num_frames", "label"
+            ]
+        else:
+            columns = ["path", "label"]
         with PathManager.open(path_to_file, "r") as f:
-            for clip_idx, path_label in enumerate(f.read().splitlines()):
-                #print('path_label = ', path_label)
-                #assert (
-                    #len(path_label.split(self.cfg.DATA.PATH_LABEL_SEPARATOR))
-                    #== 2 or
-                    #len(path_label.split(self.cfg.DATA.PATH_LABEL_SEPARATOR)) == 5
-                #)
-                if self.cfg.DATA.USE_FRAME_SEQUENCES:
-                    set_name, class_name, class_sample, num_frames, label = path_label.strip().split(
-                        self.cfg.DATA.PATH_LABEL_SEPARATOR)
-                    path = os.path.join('BharatDSL_dataset', set_name, class_name, class_sample)
-                else:
-                    path, label = path_label.split(
-                        self.cfg.DATA.PATH_LABEL_SEPARATOR
-                    )
+            # Parse the csv into typed columns, without per-line python work.
+            table = pd.read_csv(
+                f,
+                sep=self.cfg.DATA.PATH_LABEL_SEPARATOR,
+                header=None,
+                names=columns,
+                dtype={column: str for column in columns[:-1]},
+                keep_default_na=False,
+            )
+        if self.cfg.DATA.USE_FRAME_SEQUENCES:
+            prefix = os.path.join(
+                self.cfg.DATA.PATH_PREFIX, "BharatDSL_dataset", ""
+            )
+            paths = (
+                prefix
+                + table["set_name"].str.strip()
+                + os.sep
+                + table["class_name"]
+                + os.sep
+                + table["class_sample"]
+            ).tolist()
+        else:
+            paths = [
+                os.path.join(self.cfg.DATA.PATH_PREFIX, path)
+                for path in table["path"]
+            ]
 
-                for idx in range(self._num_clips):
-                    self._path_to_videos.append(
-                        os.path.join(self.cfg.DATA.PATH_PREFIX, path)
-                    )
-                    self._labels.append(int(label))
-                    self._spatial_temporal_idx.append(idx)
-                    self._video_meta[clip_idx * self._num_clips + idx] = {}
-                    if self.cfg.DATA.USE_FRAME_SEQUENCES:
-                        #self._video_meta[clip_idx * self._num_clips + idx]['fps'] = float(fps)
-                        self._video_meta[clip_idx * self._num_clips + idx]['num_frames'] = int(num_frames)
-                        #self._video_meta[clip_idx * self._num_clips + idx]['duration'] = \
-                            #None if duration == "None" else int(duration)
+        # Repeat every video for each of its clips. Per-clip integers are kept
+        # in int32 arrays rather than lists of python ints, which are smaller
+        # and stay shared with the forked data loader workers.
+        self._path_to_videos = [
+            path for path in paths for _ in range(self._num_clips)
+        ]
+        self._labels = np.repeat(
+            table["label"].to_numpy(dtype=np.int32), self._num_clips
+        )
+        self._spatial_temporal_idx = np.tile(
+            np.arange(self._num_clips, dtype=np.int32), len(table)
+        )
+        if self.cfg.DATA.USE_FRAME_SEQUENCES:
+            self._num_frames = np.repeat(
+                table["num_frames"].astype(np.int32).to_numpy(),
+                self._num_clips,
+            )
+        else:
+            # The video meta data is filled in by the decoder.
+            self._video_meta = {
+                idx: {} for idx in range(len(self._path_to_videos))
+            }
         assert (
             len(self._path_to_videos) > 0
         ), "Failed to load Kinetics split {} from {}".format(
             self.mode, path_to_file
         )
+        if self.cfg.DATA.USE_FRAME_SEQUENCES:
+            if self.cfg.DATA.USE_FRAME_SHARDS:
+                self._construct_shard_index()
+            else:
+                self._construct_frame_index()
         logger.info(
             "Constructing kinetics dataloader (size: {}) from {}".format(
                 len(self._path_to_videos), path_to_file
             )
         )
 
-    def __getitem__(self, index):
+    def _construct_frame_index(self):
         """
-        Given the video index, return the list of frames, label, and video
-        index if the video can be fetched and decoded successfully, otherwise
-        repeatly find a random video that can be decoded as a replacement.
+        Build the sorted list of frame paths of every sample once, so that
+        fetching a sample does not need to scan the file system. Frames of
+        all samples in a class directory are listed with a single scandir.
+        """
+        dir_index = {}
+        self._frame_paths = []
+        for path in self._path_to_videos:
+            dirname, sample_name = os.path.split(path)
+            if dirname not in dir_index:
+                dir_index[dirname] = _scan_frame_dir(
+                    dirname, self._frame_ext
+                )
+            self._frame_paths.append(dir_index[dirname].get(sample_name, []))
+        # Samples whose directory was already re-scanned.
+        self._refreshed = set()
+
+    def _construct_shard_index(self):
+        """
+        Locate the frames of every sample in the shard of its class. The
+        shards are memory mapped lazily, so that each data loader worker maps
+        them on its own.
+        """
+        self._shards = {}
+        self._shard_index = []
+        shard_meta = {}
+        for path in self._path_to_videos:
+            dirname, sample_name = os.path.split(path)
+            if dirname not in shard_meta:
+                path_to_meta = dirname + ".json"
+                assert PathManager.exists(
+                    path_to_meta
+                ), "{} not found".format(path_to_meta)
+                with PathManager.open(path_to_meta, "r") as f:
+                    shard_meta[dirname] = json.load(f)
+            # [offset, num frames, height, width, channel] or None.
+            self._shard_index.append(
+                (dirname + ".bin", shard_meta[dirname].get(sample_name))
+            )
+
+    def _read_frame_shard(self, index):
+        """
+        Read the decoded frames of a sample from the shard of its class.
         Args:
-            index (int): the video index provided by the pytorch sampler.
+            index (int): the video index.
         Returns:
-            frames (tensor): the frames of sampled from the video. The dimension
-                is `channel` x `num frames` x `height` x `width`.
-            label (int): the label of the current video.
-            index (int): if the video provided by pytorch sampler can be
-                decoded, then return the index of the video. If not, return the
-                index of the video replacement that can be decoded.
+            frames (tensor or None): uint8 frames of `num frames` x `height` x
+                `width` x `channel` viewing the mapped shard, or None if the
+                sample is missing from the shard.
         """
-        short_cycle_idx = None
-        # When short cycle is used, input index is a tupple.
-        if isinstance(index, tuple):
-            index, short_cycle_idx = index
+        path_to_shard, meta = self._shard_index[index]
+        if meta is None:
+            return None
+        if path_to_shard not in self._shards:
+            # Copy-on-write mapping, so that the frames are writable tensors.
+            self._shards[path_to_shard] = np.memmap(
+                path_to_shard, dtype=np.uint8, mode="c"
+            )
+        offset, shape = meta[0], meta[1:]
+        frames = self._shards[path_to_shard][
+            offset : offset + int(np.prod(shape))
+        ]
+        return torch.from_numpy(np.asarray(frames).reshape(shape))
+
+    def _refresh_frame_index(self, index):
+        """
+        Re-scan the directory of the given sample, in case its frames changed
+        on disk after the index was built. Each sample is re-scanned at most
+        once, so that a sample whose frames really mismatch the csv fails
+        fast on later fetches.
+        Args:
+            index (int): the video index.
+        """
+        if index in self._refreshed:
+            return
+        self._refreshed.add(index)
+        dirname, sample_name = os.path.split(self._path_to_videos[index])
+        self._frame_paths[index] = _scan_frame_dir(
+            dirname, self._frame_ext
+        ).get(sample_name, [])
+
+    def reset_fallback_queue(self, worker_id):
+        """
+        Draw the order in which replacement videos are tried when a video can
+        not be decoded. The order is seeded by the rank and the worker id, so
+        that it is reproducible and differs across processes and data loader
+        workers.
+        Args:
+            worker_id (int): id of the data loader worker, 0 in the main
+                process.
+        """
+        self._fallback_perm = np.random.RandomState(
+            [self.cfg.RNG_SEED, self._rank, worker_id]
+        ).permutation(len(self._path_to_videos))
+        self._fallback_cursor = 0
+
+    def _next_fallback_index(self):
+        """
+        Returns:
+            index (int): the next video to try in place of one that failed.
+        """
+        index = int(
+            self._fallback_perm[
+                self._fallback_cursor % len(self._fallback_perm)
+            ]
+        )
+        self._fallback_cursor += 1
+        return index
 
+    def _get_sampling_params(self, index, short_cycle_idx=None):
+        """
+        Get the temporal and spatial sampling parameters of a video.
+        Args:
+            index (int): the video index.
+            short_cycle_idx (int or None): the short cycle index of the batch,
+                None if short cycle is not used.
+        Returns:
+            temporal_sample_index (int): the temporal clip index, -1 for
+                random sampling.
+            spatial_sample_index (int): the spatial crop index, -1 for random
+                sampling.
+            min_scale (int): the minimal size of the short side to scale to.
+            max_scale (int): the maximal size of the short side to scale to.
+            crop_size (int): the size of the crop.
+        """
         if self.mode in ["train", "val"]:
             # -1 indicates random sampling.
             temporal_sample_index = -1
@@ -216,6 +424,81 @@ class Kinetics(torch.utils.data.Dataset):
             raise NotImplementedError(
                 "Does not support {} mode".format(self.mode)
             )
+        if self.cfg.DATA.PRERESIZED and spatial_sample_index == -1:
+            # Frames already have the target short side, so that the scaling
+            # in the random spatial sampling is skipped. Test clips are still
+            # resized to their deterministic scale.
+            min_scale = max_scale = self.cfg.DATA.TRAIN_JITTER_SCALES[1]
+        return (
+            temporal_sample_index,
+            spatial_sample_index,
+            min_scale,
+            max_scale,
+            crop_size,
+        )
+
+    def spatial_sample(
+        self, frames, index, short_cycle_idx=None, keep_float=False
+    ):
+        """
+        Perform the spatial sampling of a decoded clip of a video. With
+        `DATA.GPU_SPATIAL_SAMPLING`, it is called by the data prefetcher on
+        clips already on the GPU instead of in `__getitem__`.
+        Args:
+            frames (tensor): uint8 or float frames of shape `channel` x
+                `num frames` x `height` x `width`.
+            index (int): the index of the video the clip was decoded from.
+            short_cycle_idx (int or None): the short cycle index of the batch.
+            keep_float (bool): if True, uint8 frames that are rescaled are
+                returned as float in [0, 255] instead of uint8.
+        Returns:
+            frames (tensor): the cropped frames.
+        """
+        (
+            _,
+            spatial_sample_index,
+            min_scale,
+            max_scale,
+            crop_size,
+        ) = self._get_sampling_params(index, short_cycle_idx)
+        return utils.spatial_sampling(
+            frames,
+            spatial_idx=spatial_sample_index,
+            min_scale=min_scale,
+            max_scale=max_scale,
+            crop_size=crop_size,
+            random_horizontal_flip=self.cfg.DATA.RANDOM_FLIP,
+            inverse_uniform_sampling=self.cfg.DATA.INV_UNIFORM_SAMPLE,
+            keep_float=keep_float,
+        )
+
+    def __getitem__(self, index):
+        """
+        Given the video index, return the list of frames, label, and video
+        index if the video can be fetched and decoded successfully, otherwise
+        repeatly find a random video that can be decoded as a replacement.
+        Args:
+            index (int): the video index provided by the pytorch sampler.
+        Returns:
+            frames (tensor): the frames of sampled from the video. The dimension
+                is `channel` x `num frames` x `height` x `width`. If
+                `DATA.NORMALIZE_ON_DEVICE` is True, the frames are left as
+                uint8 without color normalization. If
+                `DATA.GPU_SPATIAL_SAMPLING` is True, the uncropped uint8
+                frames are returned in a list, before the pathway packing.
+            label (int): the label of the current video.
+            index (int): if the video provided by pytorch sampler can be
+                decoded, then return the index of the video. If not, return the
+                index of the video replacement that can be decoded.
+        """
+        short_cycle_idx = None
+        # When short cycle is used, input index is a tupple.
+        if isinstance(index, tuple):
+            index, short_cycle_idx = index
+
+        temporal_sample_index, _, min_scale, _, _ = self._get_sampling_params(
+            index, short_cycle_idx
+        )
         sampling_rate = utils.get_random_sampling_rate(
             self.cfg.MULTIGRID.LONG_CYCLE_SAMPLING_RATE,
             self.cfg.DATA.SAMPLING_RATE,
@@ -223,22 +506,35 @@ class Kinetics(torch.utils.data.Dataset):
         # Try to decode and sample a clip from a video. If the video can not be
         # decoded, repeatly find a random video replacement that can be decoded.
         for i_try in range(self._num_retries):
-            if self.cfg.DATA.USE_FRAME_SEQUENCES:
+            if (
+                self.cfg.DATA.USE_FRAME_SEQUENCES
+                and self.cfg.DATA.USE_FRAME_SHARDS
+            ):
+                # read the pre-decoded frames from the shard
+                # frames: Tensor of (num_frames, h, w, c)
+                frames = self._read_frame_shard(index)
+
+            elif self.cfg.DATA.USE_FRAME_SEQUENCES:
                 # decode selected frame jpegs
                 try:
                     #print('index = ', index)
                     tar_handler = self._path_to_videos[index]
                     #print('tar_handler = ', tar_handler)
-                    frame_list = glob.glob(os.path.join(tar_handler+'_*.png'))
+                    num_frames = int(self._num_frames[index])
+                    frame_list = self._frame_paths[index]
+                    if len(frame_list) != num_frames:
+                        self._refresh_frame_index(index)
+                        frame_list = self._frame_paths[index]
                     #print('frame_list =', frame_list)
-                    if len(frame_list) != self._video_meta[index]['num_frames']:
+                    if len(frame_list) != num_frames:
                         raise Exception("Unmatched num of frames and len of sequence")
                     elif len(frame_list) < 5:
                         raise Exception("Too few frames, video might be corrupted")
                 except Exception as e:
                     logger.info(
                         "Failed to load tar file from {} with error: {}".format(
-                            self._path_to_videos[index])
+                            self._path_to_videos[index], e
+                        )
                     )
                     tar_handler = None
 
@@ -254,18 +550,35 @@ class Kinetics(torch.utils.data.Dataset):
                         and i_try > self._num_retries // 2
                     ):
                         # let's try another one
-                        index = random.randint(0, len(self._path_to_videos) - 1)
+                        index = self._next_fallback_index()
                     continue
 
                 # temporarily select and decode frames
                 # frames: Tensor of (num_frames, h, w, c)
-                frames = decoder.decode_seq(
+                # The decoded size is part of the key, as the cache outlives
+                # the job.
+                cache_key = "{}@{}".format(
                     tar_handler,
-                    sampling_rate,
-                    frame_list,
-                    self._video_meta[index],
-                    self.cfg.DATA.NUM_FRAMES,
+                    "full" if self.cfg.DATA.PRERESIZED else "224x224",
                 )
+                frames = self._frame_cache.get(cache_key)
+                if frames is None:
+                    frames = decoder.decode_seq(
+                        tar_handler,
+                        sampling_rate,
+                        frame_list,
+                        {"num_frames": int(self._num_frames[index])},
+                        self.cfg.DATA.NUM_FRAMES,
+                        pool=_get_decode_pool(
+                            os.getpid(),
+                            self.cfg.DATA_LOADER.NUM_DECODE_THREADS,
+                        ),
+                        frame_size=(
+                            None if self.cfg.DATA.PRERESIZED else (224, 224)
+                        ),
+                    )
+                    if frames is not None:
+                        self._frame_cache.put(cache_key, frames)
                 
             else:
                 # decode videos
@@ -275,6 +588,7 @@ class Kinetics(torch.utils.data.Dataset):
                         self._path_to_videos[index],
                         self.cfg.DATA_LOADER.ENABLE_MULTI_THREAD_DECODE,
                         self.cfg.DATA.DECODING_BACKEND,
+                        self._decode_gpu_id,
                     )
                 except Exception as e:
                     logger.info(
@@ -294,7 +608,7 @@ class Kinetics(torch.utils.data.Dataset):
                         and i_try > self._num_retries // 2
                     ):
                         # let's try another one
-                        index = random.randint(0, len(self._path_to_videos) - 1)
+                        index = self._next_fallback_index()
                     continue
 
                 # Decode video. Meta info is used to perform selective decoding.
@@ -325,27 +639,36 @@ class Kinetics(torch.utils.data.Dataset):
                     and i_try > self._num_retries // 2
                 ):
                     # let's try another one
-                    index = random.randint(0, len(self._path_to_videos) - 1)
+                    index = self._next_fallback_index()
                 continue
 
-            # Perform color normalization.
-            frames = utils.tensor_normalize(
-                frames, self.cfg.DATA.MEAN, self.cfg.DATA.STD
-            )
             # T H W C -> C T H W.
             frames = frames.permute(3, 0, 1, 2)
-            # Perform data augmentation.
-            frames = utils.spatial_sampling(
+            if self.cfg.DATA.GPU_SPATIAL_SAMPLING:
+                # Return the uncropped uint8 clip. It is cropped on the GPU,
+                # then packed into pathways, by loader.DevicePrefetcher.
+                return [frames], int(self._labels[index]), index, {}
+            # Perform data augmentation before the color normalization, so
+            # that it only touches the cropped clip. Rescaled frames are kept
+            # in float when they are normalized below, instead of being
+            # rounded back to uint8.
+            frames = self.spatial_sample(
                 frames,
-                spatial_idx=spatial_sample_index,
-                min_scale=min_scale,
-                max_scale=max_scale,
-                crop_size=crop_size,
-                random_horizontal_flip=self.cfg.DATA.RANDOM_FLIP,
-                inverse_uniform_sampling=self.cfg.DATA.INV_UNIFORM_SAMPLE,
+                index,
+                short_cycle_idx,
+                keep_float=not self.cfg.DATA.NORMALIZE_ON_DEVICE,
             )
+            if not self.cfg.DATA.NORMALIZE_ON_DEVICE:
+                # Perform color normalization in a single pass over the crop:
+                # uint8 frames are converted to float once, and the float
+                # output of a rescale is normalized in place.
+                if frames.dtype == torch.uint8:
+                    frames = frames.float()
+                frames = frames.sub_(self._mean.to(frames.device)).div_(
+                    self._std.to(frames.device)
+                )
 
-            label = self._labels[index]
+            label = int(self._labels[index])
             frames = utils.pack_pathway_output(self.cfg, frames)
             return frames, label, index, {}
         else:
@@ -355,6 +678,21 @@ class Kinetics(torch.utils.data.Dataset):
                 )
             )
 
+    def __getitems__(self, indices):
+        """
+        Fetch a whole batch in one call. The data loader calls this method
+        instead of `__getitem__` for every index of the batch.
+        Args:
+            indices (list): the video indices provided by the pytorch sampler.
+        Returns:
+            batch (Batch): the collated frames, labels, indices and meta data
+                of the batch.
+        """
+        return utils.collate_samples(
+            [self.__getitem__(index) for index in indices],
+            channels_last=self.cfg.DATA.CHANNELS_LAST,
+        )
+
     def __len__(self):
         """
         Returns:
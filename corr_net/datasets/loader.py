@@ -53,6 +53,102 @@ def detection_collate(batch):
     return inputs, labels, video_idx, collated_extra_data
 
 
+def batch_collate(batch):
+    """
+    Collate function that passes through batches already collated by the
+    dataset `__getitems__`, and falls back to the default collate function
+    otherwise.
+    Args:
+        batch (Batch or list): data batch to collate.
+    Returns:
+        (Batch or tuple): collated data batch.
+    """
+    if isinstance(batch, utils.Batch):
+        return batch
+    return default_collate(batch)
+
+
+class DevicePrefetcher(object):
+    """
+    Iterate over a data loader returning uncropped uint8 clips, and prepare
+    the next batch on a side CUDA stream while the model runs on the current
+    one: the batch is copied to the GPU, and the spatial sampling and pathway
+    packing of each clip are performed there. Used with
+    `DATA.GPU_SPATIAL_SAMPLING`.
+    """
+
+    def __init__(self, loader, cfg):
+        """
+        Args:
+            loader (DataLoader): the data loader to wrap.
+            cfg (CfgNode): configs.
+        """
+        self.loader = loader
+        self.cfg = cfg
+        self._stream = torch.cuda.Stream()
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __getattr__(self, name):
+        # Expose the dataset and the samplers of the wrapped loader.
+        if name == "loader":
+            raise AttributeError(name)
+        return getattr(self.loader, name)
+
+    def _preload(self, batch):
+        """
+        Enqueue the transfer and the spatial sampling of a batch on the side
+        stream.
+        Args:
+            batch (Batch or None): batch returned by the wrapped loader.
+        Returns:
+            (tuple or None): the batch on the GPU, and the event recorded on
+                the side stream once the batch is ready.
+        """
+        if batch is None:
+            return None
+        inputs, labels, index, meta = batch
+        with torch.cuda.stream(self._stream):
+            frames = inputs[0].cuda(non_blocking=True)
+            clips = [
+                utils.pack_pathway_output(
+                    self.cfg, self.loader.dataset.spatial_sample(clip, idx)
+                )
+                for clip, idx in zip(frames, index.tolist())
+            ]
+            memory_format = (
+                torch.channels_last_3d
+                if self.cfg.DATA.CHANNELS_LAST
+                else torch.contiguous_format
+            )
+            inputs = [
+                torch.stack([clip[pathway] for clip in clips]).contiguous(
+                    memory_format=memory_format
+                )
+                for pathway in range(len(clips[0]))
+            ]
+            labels = labels.cuda(non_blocking=True)
+            index = index.cuda(non_blocking=True)
+            ready = torch.cuda.Event()
+            ready.record(self._stream)
+        return utils.Batch(inputs, labels, index, meta), ready
+
+    def __iter__(self):
+        loader_iter = iter(self.loader)
+        next_batch = self._preload(next(loader_iter, None))
+        while next_batch is not None:
+            batch, ready = next_batch
+            # Wait for the side stream before the batch is used, and keep its
+            # memory from being reused until the current stream is done.
+            current_stream = torch.cuda.current_stream()
+            current_stream.wait_event(ready)
+            for tensor in batch.inputs + [batch.labels, batch.index]:
+                tensor.record_stream(current_stream)
+            next_batch = self._preload(next(loader_iter, None))
+            yield batch
+
+
 def construct_loader(cfg, split, is_precise_bn=False):
     """
     Constructs the data loader for the given dataset.
@@ -82,6 +178,22 @@ def construct_loader(cfg, split, is_precise_bn=False):
     # Construct the dataset
     dataset = build_dataset(dataset_name, cfg, split)
 
+    pin_memory = cfg.DATA_LOADER.PIN_MEMORY
+    multiprocessing_context = None
+    if cfg.DATA.DECORD_USE_GPU:
+        # Workers returning CUDA tensors must not be forked, and CUDA tensors
+        # can not be pinned.
+        pin_memory = False
+        if cfg.DATA_LOADER.NUM_WORKERS > 0:
+            multiprocessing_context = "spawn"
+    # These options are only valid with worker processes.
+    worker_kwargs = {}
+    if cfg.DATA_LOADER.NUM_WORKERS > 0:
+        worker_kwargs = {
+            "persistent_workers": cfg.DATA_LOADER.PERSISTENT_WORKERS,
+            "prefetch_factor": cfg.DATA_LOADER.PREFETCH_FACTOR,
+        }
+
     if cfg.MULTIGRID.SHORT_CYCLE and split in ["train"] and not is_precise_bn:
         # Create a sampler for multi-process training
         sampler = utils.create_sampler(dataset, shuffle, cfg)
@@ -93,8 +205,13 @@ def construct_loader(cfg, split, is_precise_bn=False):
             dataset,
             batch_sampler=batch_sampler,
             num_workers=cfg.DATA_LOADER.NUM_WORKERS,
-            pin_memory=cfg.DATA_LOADER.PIN_MEMORY,
+            pin_memory=pin_memory,
+            collate_fn=detection_collate
+            if cfg.DETECTION.ENABLE
+            else batch_collate,
             worker_init_fn=utils.loader_worker_init_fn(dataset),
+            multiprocessing_context=multiprocessing_context,
+            **worker_kwargs,
         )
     else:
         # Create a sampler for multi-process training
@@ -106,11 +223,17 @@ def construct_loader(cfg, split, is_precise_bn=False):
             shuffle=(False if sampler else shuffle),
             sampler=sampler,
             num_workers=cfg.DATA_LOADER.NUM_WORKERS,
-            pin_memory=cfg.DATA_LOADER.PIN_MEMORY,
+            pin_memory=pin_memory,
             drop_last=drop_last,
-            collate_fn=detection_collate if cfg.DETECTION.ENABLE else None,
+            collate_fn=detection_collate
+            if cfg.DETECTION.ENABLE
+            else batch_collate,
             worker_init_fn=utils.loader_worker_init_fn(dataset),
+            multiprocessing_context=multiprocessing_context,
+            **worker_kwargs,
         )
+    if cfg.DATA.GPU_SPATIAL_SAMPLING:
+        loader = DevicePrefetcher(loader, cfg)
     return loader
 
 
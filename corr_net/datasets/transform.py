@@ -7,11 +7,17 @@ import torch
 
 
 def random_short_side_scale_jitter(
-    images, min_size, max_size, boxes=None, inverse_uniform_sampling=False
+    images,
+    min_size,
+    max_size,
+    boxes=None,
+    inverse_uniform_sampling=False,
+    keep_float=False,
 ):
     """
     Perform a spatial short scale jittering on the given images and
-    corresponding boxes.
+    corresponding boxes. uint8 images are resized in float and, unless
+    `keep_float` is True, rounded back to uint8.
     Args:
         images (tensor): images to perform scale jitter. Dimension is
             `num frames` x `channel` x `height` x `width`.
@@ -22,6 +28,9 @@ def random_short_side_scale_jitter(
         inverse_uniform_sampling (bool): if True, sample uniformly in
             [1 / max_scale, 1 / min_scale] and take a reciprocal to get the
             scale. If False, take a uniform sample from [min_scale, max_scale].
+        keep_float (bool): if True, return resized uint8 images as float
+            in [0, 255] instead of rounding them back to uint8. Images that
+            are not resized keep their dtype.
     Returns:
         (tensor): the scaled images with dimension of
             `num frames` x `channel` x `new height` x `new width`.
@@ -52,15 +61,15 @@ def random_short_side_scale_jitter(
         if boxes is not None:
             boxes = boxes * float(new_width) / width
 
-    return (
-        torch.nn.functional.interpolate(
-            images,
-            size=(new_height, new_width),
-            mode="bilinear",
-            align_corners=False,
-        ),
-        boxes,
+    resized = torch.nn.functional.interpolate(
+        images.float() if images.dtype == torch.uint8 else images,
+        size=(new_height, new_width),
+        mode="bilinear",
+        align_corners=False,
     )
+    if images.dtype == torch.uint8 and not keep_float:
+        resized = resized.round_().clamp_(0, 255).to(torch.uint8)
+    return resized, boxes
 
 
 def crop_boxes(boxes, x_offset, y_offset):
@@ -1,14 +1,16 @@
 #!/usr/bin/env python3
 
+import functools
 import logging
 import numpy as np
 import os
 import random
 import time
-from collections import defaultdict
+from collections import defaultdict, namedtuple
 import cv2
 import torch
 from fvcore.common.file_io import PathManager
+from torch.utils.data._utils.collate import default_collate
 from torch.utils.data.distributed import DistributedSampler
 
 from . import transform as transform
@@ -16,6 +18,16 @@ from . import transform as transform
 logger = logging.getLogger(__name__)
 
 
+class Batch(namedtuple("Batch", ["inputs", "labels", "index", "meta"])):
+    """
+    A batch of clips already collated by the dataset. It unpacks like the
+    `(inputs, labels, index, meta)` tuple produced by the default collate
+    function, and the data loader pins each of its tensors in memory.
+    """
+
+    __slots__ = ()
+
+
 def retry_load_images(image_paths, retry=10, backend="pytorch"):
     """
     This function is to load images with support of retrying for failed load.
@@ -70,6 +82,58 @@ def get_sequence(center_idx, half_len, sample_rate, num_frames):
     return seq
 
 
+def collate_samples(samples, channels_last=False):
+    """
+    Collate `(frames, label, index, meta)` samples into a Batch. The frames
+    of each pathway are copied into one preallocated tensor, which lives in
+    shared memory when called from a data loader worker.
+    Args:
+        samples (list): samples as returned by the dataset `__getitem__`.
+        channels_last (bool): if True, allocate the batched frames in the
+            `torch.channels_last_3d` memory format.
+    Returns:
+        batch (Batch): the collated batch. The frames of each pathway have
+            the dimension `batch` x `channel` x `num frames` x `height` x
+            `width`.
+    """
+    in_worker = torch.utils.data.get_worker_info() is not None
+    memory_format = (
+        torch.channels_last_3d if channels_last else torch.contiguous_format
+    )
+    inputs = []
+    for pathway in range(len(samples[0][0])):
+        first = samples[0][0][pathway]
+        shape = (len(samples),) + tuple(first.shape)
+        if in_worker and not first.is_cuda:
+            # Allocate the batch directly in shared memory, as the default
+            # collate function does, so that it is not copied again when
+            # sent to the main process.
+            stride = torch.empty(
+                shape,
+                dtype=first.dtype,
+                device="meta",
+                memory_format=memory_format,
+            ).stride()
+            storage = first._typed_storage()._new_shared(
+                len(samples) * first.numel(), device=first.device
+            )
+            frames = first.new(storage).as_strided(shape, stride)
+        else:
+            frames = torch.empty(
+                shape,
+                dtype=first.dtype,
+                device=first.device,
+                memory_format=memory_format,
+            )
+        for i, sample in enumerate(samples):
+            frames[i].copy_(sample[0][pathway])
+        inputs.append(frames)
+    labels = torch.tensor([sample[1] for sample in samples])
+    index = torch.tensor([sample[2] for sample in samples])
+    meta = default_collate([sample[3] for sample in samples])
+    return Batch(inputs, labels, index, meta)
+
+
 def pack_pathway_output(cfg, frames):
     """
     Prepare output as a list of tensors. Each tensor corresponding to a
@@ -114,6 +178,7 @@ def spatial_sampling(
     crop_size=224,
     random_horizontal_flip=True,
     inverse_uniform_sampling=False,
+    keep_float=False,
 ):
     """
     Perform spatial sampling on the given video frames. If spatial_idx is
@@ -135,6 +200,9 @@ def spatial_sampling(
             [1 / max_scale, 1 / min_scale] and take a reciprocal to get the
             scale. If False, take a uniform sample from [min_scale,
             max_scale].
+        keep_float (bool): if True, uint8 frames that are rescaled are
+            returned as float in [0, 255] instead of being rounded back to
+            uint8.
     Returns:
         frames (tensor): spatially sampled frames.
     """
@@ -145,6 +213,7 @@ def spatial_sampling(
             min_size=min_scale,
             max_size=max_scale,
             inverse_uniform_sampling=inverse_uniform_sampling,
+            keep_float=keep_float,
         )
         frames, _ = transform.random_crop(frames, crop_size)
         if random_horizontal_flip:
@@ -154,7 +223,7 @@ def spatial_sampling(
         # min_scale, max_scale, and crop_size are expect to be the same.
         assert len({min_scale, max_scale, crop_size}) == 1
         frames, _ = transform.random_short_side_scale_jitter(
-            frames, min_scale, max_scale
+            frames, min_scale, max_scale, keep_float=keep_float
         )
         frames, _ = transform.uniform_crop(frames, crop_size, spatial_idx)
     return frames
@@ -255,21 +324,66 @@ def load_image_lists(frame_list_file, prefix="", return_list=False):
 def tensor_normalize(tensor, mean, std):
     """
     Normalize a given tensor by subtracting the mean and dividing the std.
+    A uint8 tensor is converted to float and normalized in place in the
+    converted buffer. A float tensor is normalized in a single new buffer.
     Args:
         tensor (tensor): tensor to normalize.
         mean (tensor or list): mean value to subtract.
         std (tensor or list): std to divide.
     """
-    if tensor.dtype == torch.uint8:
-        tensor = tensor.float()
-        tensor = tensor / 255.0
     if type(mean) == list:
-        mean = torch.tensor(mean)
+        mean = torch.tensor(mean, device=tensor.device)
     if type(std) == list:
-        std = torch.tensor(std)
-    tensor = tensor - mean
-    tensor = tensor / std
-    return tensor
+        std = torch.tensor(std, device=tensor.device)
+    if tensor.dtype == torch.uint8:
+        return tensor.float().div_(255.0).sub_(mean).div_(std)
+    return (tensor - mean).div_(std)
+
+
+def normalize_inputs(inputs, mean, std):
+    """
+    Normalize a batch of uint8 clips once it has been transferred to the
+    device of the model.
+    Args:
+        inputs (list): list of uint8 tensors, one per pathway, with the
+            dimension of `batch` x `channel` x `num frames` x `height` x
+            `width`.
+        mean (list): mean value to subtract for each channel.
+        std (list): std to divide for each channel.
+    Returns:
+        inputs (list): list of the normalized float tensors.
+    """
+    assert isinstance(inputs, list), "Expected a list of pathway tensors"
+    normalized = []
+    for tensor in inputs:
+        assert (
+            tensor.dtype == torch.uint8
+        ), "Expected uint8 clips, got {}".format(tensor.dtype)
+        mean_t, std_t = _get_uint8_normalization(
+            tuple(mean), tuple(std), tensor.device
+        )
+        normalized.append(tensor.float().sub_(mean_t).div_(std_t))
+    return normalized
+
+
+@functools.lru_cache(maxsize=None)
+def _get_uint8_normalization(mean, std, device):
+    """
+    Build the mean and std tensors to normalize uint8 clips batched as
+    `batch` x `channel` x `num frames` x `height` x `width`, scaled by 255 so
+    that the conversion to [0, 1] is folded in. Cached, so that they are only
+    created once per device.
+    Args:
+        mean (tuple): mean value of each channel.
+        std (tuple): std of each channel.
+        device (torch.device): device of the clips.
+    Returns:
+        mean (tensor): mean scaled by 255.
+        std (tensor): std scaled by 255.
+    """
+    mean = torch.tensor(mean, device=device).view(1, -1, 1, 1, 1) * 255.0
+    std = torch.tensor(std, device=device).view(1, -1, 1, 1, 1) * 255.0
+    return mean, std
 
 
 def get_random_sampling_rate(long_cycle_sampling_rate, sampling_rate):
@@ -318,10 +432,22 @@ def create_sampler(dataset, shuffle, cfg):
     return sampler
 
 
+def _init_loader_worker(worker_id):
+    """
+    Reset the fallback queue of the copy of the dataset held by the worker.
+    Args:
+        worker_id (int): id of the data loader worker.
+    """
+    dataset = torch.utils.data.get_worker_info().dataset
+    dataset.reset_fallback_queue(worker_id)
+
+
 def loader_worker_init_fn(dataset):
     """
     Create init function passed to pytorch data loader.
     Args:
         dataset (torch.utils.data.Dataset): the given dataset.
     """
+    if hasattr(dataset, "reset_fallback_queue"):
+        return _init_loader_worker
     return None
@@ -3,15 +3,27 @@
 
 import av
 
+try:
+    import decord
 
-def get_video_container(path_to_vid, multi_thread_decode=False, backend="pyav"):
+    # Let decord return torch tensors.
+    decord.bridge.set_bridge("torch")
+except ImportError:
+    decord = None
+
+
+def get_video_container(
+    path_to_vid, multi_thread_decode=False, backend="pyav", gpu_id=None
+):
     """
     Given the path to the video, return the pyav video container.
     Args:
         path_to_vid (str): path to the video.
         multi_thread_decode (bool): if True, perform multi-thread decoding.
-        backend (str): decoder backend, options include `pyav` and
-            `torchvision`, default is `pyav`.
+        backend (str): decoder backend, options include `pyav`,
+            `torchvision` and `decord`, default is `pyav`.
+        gpu_id (int or None): for the `decord` backend, index of the GPU to
+            decode the video on with NVDEC. If None, decode on CPU.
     Returns:
         container (container): video container.
     """
@@ -25,5 +37,9 @@ def get_video_container(path_to_vid, multi_thread_decode=False, backend="pyav"):
             # Enable multiple threads for decoding.
             container.streams.video[0].thread_type = "AUTO"
         return container
+    elif backend == "decord":
+        assert decord is not None, "decord is required for the decord backend"
+        ctx = decord.cpu(0) if gpu_id is None else decord.gpu(gpu_id)
+        return decord.VideoReader(path_to_vid, ctx=ctx)
     else:
         raise NotImplementedError("Unknown backend {}".format(backend))
@@ -36,6 +36,13 @@ def build_model(cfg, gpu_id=None):
     name = cfg.MODEL.MODEL_NAME
     model = MODEL_REGISTRY.get(name)(cfg)
 
+    if cfg.DATA.CHANNELS_LAST:
+        # Match the memory format of the inputs. Only the 3D convolutions are
+        # converted, since the other parameters are not 5D.
+        for module in model.modules():
+            if isinstance(module, torch.nn.Conv3d):
+                module.to(memory_format=torch.channels_last_3d)
+
     if cfg.NUM_GPUS:
         if gpu_id is None:
             # Determine the GPU used by the current process
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+"""
+Re-encode the png frames of a frame sequence dataset to jpeg, optionally
+resizing them offline.
+"""
+
+import argparse
+import math
+import os
+from PIL import Image
+
+
+def parse_args():
+    """
+    Parse the arguments of the frame conversion.
+    Args:
+        src (str): root directory of the png frames.
+        dst (str): root directory to write the jpeg frames to. The directory
+            layout of `src` is kept.
+        quality (int): jpeg quality.
+        short_side (int): if larger than 0, resize the frames so that their
+            short side is `short_side`.
+    """
+    parser = argparse.ArgumentParser(
+        description="Re-encode png frames to jpeg for faster decoding."
+    )
+    parser.add_argument(
+        "--src", help="Root directory of the png frames", required=True
+    )
+    parser.add_argument(
+        "--dst", help="Root directory of the jpeg frames", required=True
+    )
+    parser.add_argument(
+        "--quality", help="Jpeg quality", default=95, type=int
+    )
+    parser.add_argument(
+        "--short_side",
+        help="Short side to resize the frames to, 0 to keep the size",
+        default=0,
+        type=int,
+    )
+    return parser.parse_args()
+
+
+def short_side_resize(img, size):
+    """
+    Resize an image, keeping its aspect ratio, so that its short side is
+    `size`.
+    Args:
+        img (Image): image to resize.
+        size (int): size of the short side.
+    Returns:
+        img (Image): resized image.
+    """
+    width, height = img.size
+    if min(width, height) == size:
+        return img
+    if width < height:
+        new_size = (size, int(math.floor(float(height) / width * size)))
+    else:
+        new_size = (int(math.floor(float(width) / height * size)), size)
+    return img.resize(new_size, Image.BILINEAR)
+
+
+def convert_frames(src, dst, quality=95, short_side=0):
+    """
+    Re-encode every png frame under `src` to a jpeg frame under `dst`.
+    Args:
+        src (str): root directory of the png frames.
+        dst (str): root directory of the jpeg frames.
+        quality (int): jpeg quality.
+        short_side (int): if larger than 0, resize the frames so that their
+            short side is `short_side`.
+    """
+    for dirpath, _, filenames in os.walk(src):
+        out_dir = os.path.join(dst, os.path.relpath(dirpath, src))
+        os.makedirs(out_dir, exist_ok=True)
+        for filename in filenames:
+            name, ext = os.path.splitext(filename)
+            if ext.lower() != ".png":
+                continue
+            with Image.open(os.path.join(dirpath, filename)) as img:
+                img = img.convert("RGB")
+            if short_side > 0:
+                img = short_side_resize(img, short_side)
+            img.save(os.path.join(out_dir, name + ".jpg"), quality=quality)
+
+
+def main():
+    """
+    Convert the frames. Train with `DATA.FRAME_SEQUENCE_TEMPLATE` set to
+    "_{:02d}.jpg" and `DATA.PATH_PREFIX` pointing to the converted frames.
+    If the frames are resized to `DATA.TRAIN_JITTER_SCALES[1]`, also set
+    `DATA.PRERESIZED` to True.
+    """
+    args = parse_args()
+    convert_frames(args.src, args.dst, args.quality, args.short_side)
+
+
+if __name__ == "__main__":
+    main()
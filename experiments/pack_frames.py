@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+"""Pack the frame sequences of a dataset into one binary shard per class."""
+
+import argparse
+import glob
+import json
+import os
+from collections import OrderedDict
+
+from corr_net.datasets import decoder
+
+
+def parse_args():
+    """
+    Parse the arguments of the frame packing.
+    Args:
+        csv (list): csv files of the splits to pack, in the format read by
+            the Kinetics loader with `DATA.USE_FRAME_SEQUENCES`.
+        path_prefix (str): same as `DATA.PATH_PREFIX`.
+        separator (str): same as `DATA.PATH_LABEL_SEPARATOR`.
+        ext (str): file extension of the frames.
+        preresized (bool): if True, keep the size of the frames, which were
+            resized offline. Otherwise resize them as the loader does.
+    """
+    parser = argparse.ArgumentParser(
+        description="Pack decoded frames into memory mappable shards."
+    )
+    parser.add_argument(
+        "--csv", help="Csv files of the splits to pack", nargs="+",
+        required=True,
+    )
+    parser.add_argument(
+        "--path_prefix", help="Path prefix of the frames", default="",
+    )
+    parser.add_argument(
+        "--separator", help="Separator of the csv files", default=",",
+    )
+    parser.add_argument(
+        "--ext", help="File extension of the frames", default=".png",
+    )
+    parser.add_argument(
+        "--preresized",
+        help="Keep the size of frames resized by convert_frames.py",
+        action="store_true",
+    )
+    return parser.parse_args()
+
+
+def read_class_samples(path_to_csv, path_prefix, separator):
+    """
+    Group the samples of a split by the directory of their class.
+    Args:
+        path_to_csv (str): csv file of the split.
+        path_prefix (str): path prefix of the frames.
+        separator (str): separator of the csv file.
+    Returns:
+        class_samples (OrderedDict): maps the directory of each class to the
+            list of (sample name, number of frames) of the class.
+    """
+    class_samples = OrderedDict()
+    with open(path_to_csv, "r") as f:
+        for line in f.read().splitlines():
+            set_name, class_name, class_sample, num_frames, _ = (
+                line.strip().split(separator)
+            )
+            class_dir = os.path.join(
+                path_prefix, "BharatDSL_dataset", set_name, class_name
+            )
+            class_samples.setdefault(class_dir, []).append(
+                (class_sample, int(num_frames))
+            )
+    return class_samples
+
+
+def pack_class(class_dir, samples, ext=".png", preresized=False):
+    """
+    Decode the frames of every valid sample of a class and write them to
+    `<class_dir>.bin`, together with the index `<class_dir>.json` that maps
+    each sample name to `[offset, num frames, height, width, channel]` of its
+    uint8 frames in the shard.
+    Args:
+        class_dir (str): directory of the frames of the class.
+        samples (list): list of (sample name, number of frames).
+        ext (str): file extension of the frames.
+        preresized (bool): if True, keep the size of the frames.
+    """
+    index = {}
+    offset = 0
+    with open(class_dir + ".bin", "wb") as f:
+        for sample_name, num_frames in samples:
+            path = os.path.join(class_dir, sample_name)
+            frame_list = sorted(glob.glob(path + "_*" + ext))
+            # Same checks as the Kinetics loader, so that the samples it
+            # rejects are missing from the shard and retried at loading time.
+            if len(frame_list) != num_frames:
+                print(
+                    "Skip {}: unmatched num of frames and len of "
+                    "sequence".format(path)
+                )
+                continue
+            elif len(frame_list) < 5:
+                print(
+                    "Skip {}: too few frames, video might be "
+                    "corrupted".format(path)
+                )
+                continue
+            frames = decoder.decode_seq(
+                path,
+                1,
+                frame_list,
+                {"num_frames": num_frames},
+                0,
+                frame_size=None if preresized else (224, 224),
+            )
+            if frames is None:
+                print("Skip {}: failed to decode the frames".format(path))
+                continue
+            frames = frames.numpy()
+            f.write(frames.tobytes())
+            index[sample_name] = [offset] + list(frames.shape)
+            offset += frames.nbytes
+    with open(class_dir + ".json", "w") as f:
+        json.dump(index, f)
+
+
+def main():
+    """
+    Pack the frames. Train with `DATA.USE_FRAME_SHARDS` set to True.
+    """
+    args = parse_args()
+    for path_to_csv in args.csv:
+        class_samples = read_class_samples(
+            path_to_csv, args.path_prefix, args.separator
+        )
+        for class_dir, samples in class_samples.items():
+            pack_class(class_dir, samples, args.ext, args.preresized)
+
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,7 @@ import corr_net.utils.logging as logging
 import corr_net.utils.misc as misc
 import corr_net.visualization.tensorboard_vis as tb
 from corr_net.datasets import loader
+from corr_net.datasets import utils as data_utils
 from corr_net.models import build_model
 from corr_net.utils.meters import TestMeter
 
@@ -56,14 +57,18 @@ def perform_test(test_loader, model, test_meter, cfg, writer=None):
                 inputs = inputs.cuda(non_blocking=True)
 
             # Transfer the data to the current GPU device.
-            labels = labels.cuda()
-            video_idx = video_idx.cuda()
+            labels = labels.cuda(non_blocking=True)
+            video_idx = video_idx.cuda(non_blocking=True)
             for key, val in meta.items():
                 if isinstance(val, (list,)):
                     for i in range(len(val)):
                         val[i] = val[i].cuda(non_blocking=True)
                 else:
                     meta[key] = val.cuda(non_blocking=True)
+        if cfg.DATA.NORMALIZE_ON_DEVICE:
+            inputs = data_utils.normalize_inputs(
+                inputs, cfg.DATA.MEAN, cfg.DATA.STD
+            )
         test_meter.data_toc()
 
         if cfg.DETECTION.ENABLE:
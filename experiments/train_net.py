@@ -17,6 +17,7 @@ import corr_net.utils.metrics as metrics
 import corr_net.utils.misc as misc
 import corr_net.visualization.tensorboard_vis as tb
 from corr_net.datasets import loader
+from corr_net.datasets import utils as data_utils
 from corr_net.models import build_model
 from corr_net.utils.meters import TrainMeter, ValMeter
 from corr_net.utils.multigrid import MultigridSchedule
@@ -55,13 +56,17 @@ def train_epoch(
                     inputs[i] = inputs[i].cuda(non_blocking=True)
             else:
                 inputs = inputs.cuda(non_blocking=True)
-            labels = labels.cuda()
+            labels = labels.cuda(non_blocking=True)
             for key, val in meta.items():
                 if isinstance(val, (list,)):
                     for i in range(len(val)):
                         val[i] = val[i].cuda(non_blocking=True)
                 else:
                     meta[key] = val.cuda(non_blocking=True)
+        if cfg.DATA.NORMALIZE_ON_DEVICE:
+            inputs = data_utils.normalize_inputs(
+                inputs, cfg.DATA.MEAN, cfg.DATA.STD
+            )
 
         # Update the learning rate.
         lr = optim.get_epoch_lr(cur_epoch + float(cur_iter) / data_size, cfg)
@@ -187,13 +192,17 @@ def eval_epoch(val_loader, model, val_meter, cur_epoch, cfg, writer=None):
                     inputs[i] = inputs[i].cuda(non_blocking=True)
             else:
                 inputs = inputs.cuda(non_blocking=True)
-            labels = labels.cuda()
+            labels = labels.cuda(non_blocking=True)
             for key, val in meta.items():
                 if isinstance(val, (list,)):
                     for i in range(len(val)):
                         val[i] = val[i].cuda(non_blocking=True)
                 else:
                     meta[key] = val.cuda(non_blocking=True)
+        if cfg.DATA.NORMALIZE_ON_DEVICE:
+            inputs = data_utils.normalize_inputs(
+                inputs, cfg.DATA.MEAN, cfg.DATA.STD
+            )
         val_meter.data_toc()
 
         if cfg.DETECTION.ENABLE:
@@ -281,7 +290,9 @@ def eval_epoch(val_loader, model, val_meter, cur_epoch, cfg, writer=None):
     val_meter.reset()
 
 
-def calculate_and_update_precise_bn(loader, model, num_iters=200, use_gpu=True):
+def calculate_and_update_precise_bn(
+    loader, model, num_iters=200, use_gpu=True, cfg=None
+):
     """
     Update the stats in bn layers by calculate the precise stats.
     Args:
@@ -289,6 +300,8 @@ def calculate_and_update_precise_bn(loader, model, num_iters=200, use_gpu=True):
         model (model): model to update the bn stats.
         num_iters (int): number of iterations to compute and update the bn stats.
         use_gpu (bool): whether to use GPU or not.
+        cfg (CfgNode, optional): configs. If given and
+            `DATA.NORMALIZE_ON_DEVICE` is True, normalize the inputs.
     """
 
     def _gen_loader():
@@ -299,6 +312,10 @@ def calculate_and_update_precise_bn(loader, model, num_iters=200, use_gpu=True):
                         inputs[i] = inputs[i].cuda(non_blocking=True)
                 else:
                     inputs = inputs.cuda(non_blocking=True)
+            if cfg is not None and cfg.DATA.NORMALIZE_ON_DEVICE:
+                inputs = data_utils.normalize_inputs(
+                    inputs, cfg.DATA.MEAN, cfg.DATA.STD
+                )
             yield inputs
 
     # Update the bn stats.
@@ -472,6 +489,7 @@ def train(cfg):
                 model,
                 min(cfg.BN.NUM_BATCHES_PRECISE, len(precise_bn_loader)),
                 cfg.NUM_GPUS > 0,
+                cfg,
             )
         _ = misc.aggregate_sub_bn_stats(model)
 
@@ -22,6 +22,10 @@ setup(
         "sklearn",
         "tensorboard"
     ],
-    extras_require={"tensorboard_video_visualization": ["moviepy"]},
+    extras_require={
+        "tensorboard_video_visualization": ["moviepy"],
+        "fast_frame_decoding": ["PyTurboJPEG", "pyspng"],
+        "decord": ["decord"],
+    },
     packages=find_packages(exclude=("configs", "tests")),
 )